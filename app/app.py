@@ -1,60 +1,157 @@
-from flask import Flask, request, abort, jsonify
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+from flask import Flask, Response, request, abort, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy  # Import SQLAlchemy
 from flask_migrate import Migrate  # Import Flask-Migrate
 from app.models import setup_db, Actor, Movie, db
-from app.auth import AuthError, requires_auth
+from app.auth import AuthError, requires_auth, warm_jwks_cache
 from datetime import datetime
+from sqlalchemy import select, update
 
 # Ensure a single instance of SQLAlchemy is created and used
 migrate = Migrate()
 
+logger = logging.getLogger(__name__)
+_log_listener = None
+
+# Error bodies never change, so they are encoded once instead of per response
+_BAD_REQUEST = (b'{"success":false,"error":400,"message":"Bad request"}', 400)
+_NOT_FOUND = (b'{"success":false,"error":404,"message":"Resource not found"}', 404)
+_UNPROCESSABLE = (b'{"success":false,"error":422,"message":"Unprocessable entity"}', 422)
+_SERVER_ERROR = (b'{"success":false,"error":500,"message":"Internal server error"}', 500)
+
+_READ_ONLY_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+def configure_logging():
+    """Sends log records through a queue so request threads never block writing to stderr
+
+    Called by the process that hosts the app (gunicorn's post_fork, or __main__),
+    not by create_app(), so test runners and other hosts keep their own logging.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    log_queue = queue.Queue(-1)
+    _log_listener = QueueListener(log_queue, logging.StreamHandler())
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes and decodes with orjson instead of the stdlib"""
+
+    def dumps(self, obj, **kwargs):
+        # orjson serializes datetimes natively; anything else it can't handle
+        # falls back to Flask's default conversions
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        # Used by request.get_json() for POST/PATCH bodies
+        return orjson.loads(s)
+
+
+def parse_release_date(value):
+    """Parses an ISO 8601 release date from a request body, aborting with 400 if it's malformed"""
+    try:
+        # Accepts both "2024-01-01" and "2024-01-01T00:00:00"; only the date is stored
+        return datetime.fromisoformat(value).date()
+    except (TypeError, ValueError):
+        abort(400)
+
+
 def create_app(test_config=None):
     app = Flask(__name__)
-    
+    app.json = ORJSONProvider(app)  # Use orjson for every jsonify() response
+
     app.config.from_object('config.Config')
+    if test_config is not None:
+        app.config.update(test_config)  # e.g. the tests' in-memory database
 
     setup_db(app)
     migrate.init_app(app, db)  # Initialize Flask-Migrate with the app and db
 
-    CORS(app)
+    # flask-cors adds the preflight Allow-Headers / Allow-Methods headers itself
+    CORS(app, methods=['GET', 'POST', 'PATCH', 'DELETE'], allow_headers=['Content-Type', 'Authorization'])
+    if not app.testing:
+        warm_jwks_cache()  # Fetch Auth0 signing keys before the first request needs them
+
+    @app.before_request
+    def answer_preflight():
+        # Preflights carry no token, so answer them before the auth decorators run,
+        # but only for a registered route that serves the requested method;
+        # everything else falls through to normal routing (404 / Flask's OPTIONS)
+        if request.method != 'OPTIONS' or request.url_rule is None:
+            return None
+        requested = request.headers.get('Access-Control-Request-Method')
+        if requested and requested in app.make_default_options_response().allow:
+            return '', 204
 
     @app.before_request
     def log_request():
-        print(f"🔍 Received request: {request.method} {request.path}")
-        print(f"🔍 Headers: {request.headers}")
+        logger.debug("🔍 Received request: %s %s", request.method, request.path)
+        logger.debug("🔍 Headers: %s", request.headers)
 
     @app.after_request
-    def after_request(response):
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PATCH,DELETE,OPTIONS')
+    def commit_session(response):
+        # Reads have nothing to commit; just end the transaction so its snapshot
+        # and pooled connection are released without a COMMIT round-trip
+        if request.method in _READ_ONLY_METHODS:
+            db.session.close()
+            return response
+        # Unit of work: everything a request changed is committed once, here
+        if response.status_code >= 400:
+            db.session.rollback()
+            return response
+        try:
+            db.session.commit()
+        except Exception as e:
+            logger.warning("🚨 Error committing request: %s", e)
+            db.session.rollback()
+            return Response(_UNPROCESSABLE[0], status=_UNPROCESSABLE[1], mimetype='application/json')
         return response
 
     @app.route('/actors', methods=['GET'])
     @requires_auth('get:actors')
     def get_actors(payload):
         try:
-            actors = Actor.query.all()
-            return jsonify({
-                'success': True,
-                'actors': [actor.format() for actor in actors]
-            }), 200
+            # A matching If-None-Match is answered from the table's version row,
+            # before the list query runs or any JSON is built
+            etag = Actor.list_etag()
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers={'ETag': f'"{etag}"'})
+            # The database hands back the finished JSON array, so no per-row work happens here
+            actors_json = Actor.list_json()
+            response = Response(f'{{"success":true,"actors":{actors_json}}}', status=200, mimetype='application/json')
+            response.set_etag(etag)
+            return response
         except Exception as e:
             abort(500)
 
     @app.route('/movies', methods=['GET'])
     @requires_auth('get:movies')
     def get_movies(payload):
-        print("✅ Entered get_movies() route")  # Debugging
+        logger.debug("✅ Entered get_movies() route")
 
         try:
-            movies = Movie.query.all()
-            print(f"🔍 Retrieved {len(movies)} movies from database")
-
-            return jsonify({
-                'success': True,
-                'movies': [movie.format() for movie in movies]
-            }), 200
+            etag = Movie.list_etag()
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers={'ETag': f'"{etag}"'})
+            movies_json = Movie.list_json()
+            response = Response(f'{{"success":true,"movies":{movies_json}}}', status=200, mimetype='application/json')
+            response.set_etag(etag)
+            return response
 
         except Exception as e:
             abort(500)
@@ -89,11 +186,14 @@ def create_app(test_config=None):
         
         if not ('title' in body and 'release_date' in body):
             abort(400)
-            
+
+        # Parse before touching the database so a bad date is a 400, not a 422
+        release_date = parse_release_date(body['release_date'])
+
         try:
             movie = Movie(
                 title=body['title'],
-                release_date=datetime.fromisoformat(body['release_date'])
+                release_date=release_date
             )
             movie.insert()
             
@@ -102,135 +202,112 @@ def create_app(test_config=None):
                 'created': movie.id
             }), 201
         except Exception as e:
-            print(f"Database error: {e}")  # Debugging print
+            logger.warning("Database error: %s", e)
             abort(422)
 
     @app.route('/actors/<int:actor_id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def update_actor(payload, actor_id):
-        actor = Actor.query.get(actor_id)
-        if not actor:
-            abort(404)
-            
         body = request.get_json()
-        
+        changes = {field: body[field] for field in ('name', 'age', 'gender') if field in body}
+
         try:
-            if 'name' in body:
-                actor.name = body['name']
-            if 'age' in body:
-                actor.age = body['age']
-            if 'gender' in body:
-                actor.gender = body['gender']
-            
-            print(f"Updating actor: {actor}")  # Debugging
-            db.session.add(actor)  # Ensure the actor object is attached to the session
-            db.session.commit()  # Explicitly commit changes
-            print(f"Actor updated: {actor}")  # Debugging
-            
-            formatted_actor = actor.format()
-            print(f"Formatted actor: {formatted_actor}")  # Debugging
-            
-            return jsonify({
-                'success': True,
-                'actor': formatted_actor
-            }), 200
+            # One UPDATE ... RETURNING instead of a SELECT followed by an UPDATE
+            columns = (Actor.id, Actor.name, Actor.age, Actor.gender)
+            if changes:
+                stmt = update(Actor).where(Actor.id == actor_id).values(**changes).returning(*columns)
+            else:
+                stmt = select(*columns).where(Actor.id == actor_id)
+            row = db.session.execute(stmt).first()
         except Exception as e:
-            print(f"🚨 Error updating actor: {str(e)}")  # Debugging
-            db.session.rollback()  # Ensure rollback on failure
+            logger.warning("🚨 Error updating actor: %s", e)
             abort(422)
 
+        if row is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'actor': dict(row._mapping)
+        }), 200
+
     @app.route('/movies/<int:movie_id>', methods=['PATCH'])
     @requires_auth('patch:movies')
     def update_movie(payload, movie_id):
-        movie = Movie.query.get(movie_id)
-        if not movie:
-            abort(404)
-
         body = request.get_json()
-        
-        try:
-            # Ensure the movie object is attached to the session
-            movie = db.session.merge(movie)  
-            
-            if 'title' in body:
-                movie.title = body['title']
-            if 'release_date' in body:
-                movie.release_date = datetime.fromisoformat(body['release_date'])
+        changes = {}
+        if 'title' in body:
+            changes['title'] = body['title']
+        if 'release_date' in body:
+            changes['release_date'] = parse_release_date(body['release_date'])
 
-            db.session.commit()  # Explicitly commit changes
-            
-            return jsonify({
-                'success': True,
-                'movie': movie.format()
-            }), 200
+        try:
+            columns = (Movie.id, Movie.title, Movie.release_date)
+            if changes:
+                stmt = update(Movie).where(Movie.id == movie_id).values(**changes).returning(*columns)
+            else:
+                stmt = select(*columns).where(Movie.id == movie_id)
+            row = db.session.execute(stmt).first()
         except Exception as e:
-            print(f"🚨 Error updating movie: {str(e)}")  # Debugging
-            db.session.rollback()  # Ensure rollback on failure
+            logger.warning("🚨 Error updating movie: %s", e)
             abort(422)
 
+        if row is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'movie': dict(row._mapping)
+        }), 200
+
     @app.route('/actors/<int:actor_id>', methods=['DELETE'])
     @requires_auth('delete:actors')
     def delete_actor(payload, actor_id):
-        actor = Actor.query.get(actor_id)
-        if not actor:
-            abort(404)
-            
         try:
-            actor.delete()
-            return jsonify({
-                'success': True,
-                'deleted': actor_id
-            }), 200
+            # DELETE ... RETURNING tells us whether the row existed without a SELECT first
+            deleted = Actor.delete_by_id(actor_id)
         except Exception as e:
             abort(422)
 
+        if deleted is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'deleted': deleted
+        }), 200
+
     @app.route('/movies/<int:movie_id>', methods=['DELETE'])
     @requires_auth('delete:movies')
     def delete_movie(payload, movie_id):
-        movie = Movie.query.get(movie_id)
-        if not movie:
-            abort(404)
-            
         try:
-            movie.delete()
-            return jsonify({
-                'success': True,
-                'deleted': movie_id
-            }), 200
+            deleted = Movie.delete_by_id(movie_id)
         except Exception as e:
             abort(422)
 
+        if deleted is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'deleted': deleted
+        }), 200
+
     @app.errorhandler(400)
     def bad_request(error):
-        return jsonify({
-            "success": False,
-            "error": 400,
-            "message": "Bad request"
-        }), 400
+        return Response(_BAD_REQUEST[0], status=_BAD_REQUEST[1], mimetype='application/json')
 
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
-            "success": False,
-            "error": 404,
-            "message": "Resource not found"
-        }), 404
+        return Response(_NOT_FOUND[0], status=_NOT_FOUND[1], mimetype='application/json')
 
     @app.errorhandler(422)
     def unprocessable(error):
-        return jsonify({
-            "success": False,
-            "error": 422,
-            "message": "Unprocessable entity"
-        }), 422
+        return Response(_UNPROCESSABLE[0], status=_UNPROCESSABLE[1], mimetype='application/json')
 
     @app.errorhandler(500)
     def server_error(error):
-        return jsonify({
-            "success": False,
-            "error": 500,
-            "message": "Internal server error"
-        }), 500
+        return Response(_SERVER_ERROR[0], status=_SERVER_ERROR[1], mimetype='application/json')
 
     @app.errorhandler(AuthError)
     def auth_error(error):
@@ -242,7 +319,8 @@ def create_app(test_config=None):
 
     return app
 
-app = create_app()
-
+# No app is built at import: gunicorn calls the factory (see Procfile), and
+# `flask` finds create_app() through FLASK_APP=app.app
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    configure_logging()
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -1,33 +1,73 @@
 import json
+import logging
 from functools import wraps
-from jose import jwt
+import jwt
+from jwt.algorithms import RSAAlgorithm
 from urllib.request import urlopen
 from flask import request, g
 from werkzeug.exceptions import HTTPException
 import requests 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import socket
 import os
+import threading
+import time
+from cachetools import TTLCache
 from dotenv import load_dotenv  
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.getenv('API_AUDIENCE')
 
 
-JWKS_CACHE = {}  # Store JWKS keys in memory to prevent constant network requests
+JWKS_TTL = 3600  # Re-validate the JWKS against Auth0 once an hour so rotated keys get picked up
+JWKS_CACHE = TTLCache(maxsize=2, ttl=JWKS_TTL)  # domain -> {kid: parsed RSA public key}
+_JWKS_ETAGS = {}  # domain -> (etag, {kid: parsed RSA public key}) from the last successful fetch
+_JWKS_LOCK = threading.Lock()
+JWKS_RETRY_AFTER = 60  # After a failed refresh, serve the last good keys this long before trying Auth0 again
+_JWKS_NEXT_RETRY = {}  # domain -> time.monotonic() before which a failed refresh isn't retried
+
+
+def new_jwks_session():
+    """Builds a keep-alive session for Auth0 so JWKS refreshes skip the TCP + TLS handshake"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=4,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    ))
+    return session
+
+
+SESSION = new_jwks_session()
+
+
+def _reset_after_fork():
+    """Gives each forked worker its own lock and connection instead of the master's"""
+    global _JWKS_LOCK, SESSION
+    _JWKS_LOCK = threading.Lock()
+    SESSION = new_jwks_session()
+
+
+# Forked workers keep the JWKS cache the master filled (see gunicorn.conf.py),
+# but must not share its lock or its open sockets
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def test_connection():
-    """Test if Flask can reach Auth0"""
+    """Test if Flask can reach Auth0 (for manual troubleshooting, not the request path)"""
     try:
-        host = "your_auth0_domain"  # Replace this with the actual domain
+        host = AUTH0_DOMAIN
         port = 443  # HTTPS port
         socket.create_connection((host, port), timeout=5)
-        print("✅ Flask can connect to Auth0!")
+        logger.info("✅ Flask can connect to Auth0!")
     except Exception as e:
-        print(f"🚨 Flask CANNOT connect to Auth0: {e}")
+        logger.error("🚨 Flask CANNOT connect to Auth0: %s", e)
 
 
 class AuthError(Exception):
@@ -37,25 +77,68 @@ class AuthError(Exception):
         self.status_code = status_code
 
 def fetch_jwks_keys():
-    """Fetch JWKS keys from Auth0 (caching enabled to prevent timeouts)"""
-    global JWKS_CACHE
-    if not JWKS_CACHE:  # Only fetch if cache is empty
-        print("🔍 Fetching JWKS keys from Auth0...")
+    """Fetch JWKS keys from Auth0 as a {kid: parsed RSA public key} dict (cached for JWKS_TTL seconds)"""
+    # Use a single [] lookup: .get() checks `in` and then indexes, and raises KeyError
+    # if another thread expires the entry between the two
+    try:
+        return JWKS_CACHE[AUTH0_DOMAIN]
+    except KeyError:
+        pass
+
+    with _JWKS_LOCK:
+        # Another thread may have refreshed the cache while we waited on the lock
+        try:
+            return JWKS_CACHE[AUTH0_DOMAIN]
+        except KeyError:
+            pass
+
+        etag, keys = _JWKS_ETAGS.get(AUTH0_DOMAIN, (None, None))
+        if keys is not None and time.monotonic() < _JWKS_NEXT_RETRY.get(AUTH0_DOMAIN, 0):
+            return keys  # Auth0 failed recently; keep serving the last good keys
 
-        test_connection()  # Test network connectivity before making request
+        logger.info("🔍 Fetching JWKS keys from Auth0...")
+        headers = {'If-None-Match': etag} if etag else {}
 
         try:
-            response = requests.get(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json', timeout=5)
-            response.raise_for_status()
-            JWKS_CACHE = response.json()
-            print("✅ Successfully fetched JWKS keys from Auth0")
+            response = SESSION.get(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json', headers=headers, timeout=(1, 3))
+            if response.status_code == 304 and keys is not None:
+                logger.info("✅ JWKS keys unchanged on Auth0, keeping cached keys")
+            else:
+                response.raise_for_status()
+                # Parse each key once here rather than on every token verification
+                keys = {
+                    key['kid']: RSAAlgorithm.from_jwk(key)
+                    for key in response.json()['keys']
+                    if key.get('kty') == 'RSA'
+                }
+                etag = response.headers.get('ETag')
+                logger.info("✅ Successfully fetched JWKS keys from Auth0")
         except requests.exceptions.RequestException as e:
-            print(f"🚨 Failed to fetch JWKS keys: {e}")
+            if keys is not None:
+                # Stale-if-error: an Auth0 outage shouldn't fail every request while we hold good keys
+                logger.warning("🚨 Failed to refresh JWKS keys, serving the last good set: %s", e)
+                _JWKS_NEXT_RETRY[AUTH0_DOMAIN] = time.monotonic() + JWKS_RETRY_AFTER
+                return keys
+            logger.error("🚨 Failed to fetch JWKS keys: %s", e)
             raise AuthError({
                 'code': 'jwks_fetch_failed',
                 'description': 'Failed to fetch JWKS keys from Auth0'
             }, 500)
-    return JWKS_CACHE
+
+        _JWKS_ETAGS[AUTH0_DOMAIN] = (etag, keys)
+        JWKS_CACHE[AUTH0_DOMAIN] = keys
+    return keys
+
+
+def warm_jwks_cache():
+    """Populate the JWKS cache in a background thread so the first request doesn't pay for it"""
+    def warm():
+        try:
+            fetch_jwks_keys()
+        except AuthError:
+            pass  # The request path will retry the fetch on the next cache miss
+
+    threading.Thread(target=warm, daemon=True).start()
 
 
 def get_token_auth_header():
@@ -92,17 +175,18 @@ def get_token_auth_header():
 def check_permissions(permission, payload):
     """Checks if the required permission exists in the JWT payload"""
     if 'permissions' not in payload:
-        print("🚨 No permissions found in token!", payload)  # Debugging
+        logger.debug("🚨 No permissions found in token! %s", payload)
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
 
-    token_permissions = [perm.strip() for perm in payload['permissions']]
-    print("🔍 Token permissions:", token_permissions)  # Debugging
+    # Auth0 can issue padded permission strings (e.g. "patch:actors "), so compare stripped values
+    token_permissions = frozenset(map(str.strip, payload['permissions']))
+    logger.debug("🔍 Token permissions: %s", token_permissions)
 
     if permission not in token_permissions:
-        print(f"🚨 Missing permission: {permission}")  # Debugging
+        logger.debug("🚨 Missing permission: %s", permission)
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permission not found.'
@@ -113,73 +197,75 @@ def check_permissions(permission, payload):
 def verify_decode_jwt(token):
     
     """Verifies and decodes the JWT using Auth0"""
-    print("🔍 Fetching JWKS keys from Auth0...")  # Debugging
+    logger.debug("🔍 Fetching JWKS keys from Auth0...")
 
     try:
         jwks = fetch_jwks_keys()
     except Exception as e:
-        print(f"🚨 Failed to fetch JWKS keys: {str(e)}")  # Debugging
+        logger.error("🚨 Failed to fetch JWKS keys: %s", e)
         raise AuthError({
             'code': 'jwks_fetch_failed',
             'description': 'Failed to fetch JWKS keys from Auth0'
         }, 500)
 
-    print("🔍 Extracting unverified JWT header...")  # Debugging
-    unverified_header = jwt.get_unverified_header(token)
+    logger.debug("🔍 Extracting unverified JWT header...")
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.DecodeError:
+        logger.debug("🚨 Invalid token: header can't be decoded")
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
     
     if 'kid' not in unverified_header:
-        print("🚨 Invalid token: No 'kid' found")  # Debugging
+        logger.debug("🚨 Invalid token: No 'kid' found")
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    rsa_key = {}
-    print("🔍 Searching for matching JWKS key...")  # Debugging
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    
-    if rsa_key:
+    logger.debug("🔍 Searching for matching JWKS key...")
+    rsa_key = jwks.get(unverified_header['kid'])
+
+    if rsa_key is not None:
         try:
-            print("🔍 Decoding JWT with found JWKS key...")  # Debugging
+            logger.debug("🔍 Decoding JWT with found JWKS key...")
             payload = jwt.decode(
                 token,
                 rsa_key,
-                algorithms=['RS256'],
+                algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
                 issuer=f'https://{AUTH0_DOMAIN}/'
             )
-            print(f"✅ Token Decoded Successfully: {payload}")  # Debugging
+            logger.debug("✅ Token Decoded Successfully: %s", payload)
             return payload
 
         except jwt.ExpiredSignatureError:
-            print("🚨 Token Expired")  # Debugging
+            logger.debug("🚨 Token Expired")
             raise AuthError({
                 'code': 'token_expired',
                 'description': 'Token expired.'
             }, 401)
 
-        except jwt.JWTClaimsError:
-            print("🚨 Invalid Token Claims")  # Debugging
+        except (jwt.InvalidAudienceError, jwt.InvalidIssuerError, jwt.MissingRequiredClaimError,
+                jwt.ImmatureSignatureError, jwt.InvalidIssuedAtError):
+            # Everything python-jose reported as a JWTClaimsError
+            logger.debug("🚨 Invalid Token Claims")
             raise AuthError({
                 'code': 'invalid_claims',
                 'description': 'Incorrect claims. Check the audience and issuer.'
             }, 401)
 
-        except Exception as e:
-            print(f"🚨 Token verification failed: {str(e)}")  # Debugging
+        except jwt.InvalidTokenError as e:
+            # Bad signature or an undecodable token; still an authentication failure
+            logger.debug("🚨 Token verification failed: %s", e)
             raise AuthError({
                 'code': 'invalid_header',
                 'description': 'Unable to parse authentication token.'
-            }, 400)
+            }, 401)
 
-    print("🚨 Unable to find the appropriate JWKS key")  # Debugging
+    logger.debug("🚨 Unable to find the appropriate JWKS key")
     raise AuthError({
         'code': 'invalid_header',
         'description': 'Unable to find the appropriate key.'
@@ -190,23 +276,23 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            print("🔍 Checking Authorization Header...")
+            logger.debug("🔍 Checking Authorization Header...")
             
             try:
                 token = get_token_auth_header()
-                print(f"🔍 Extracted Token: {token[:20]}...")
+                logger.debug("🔍 Extracted Token: %s...", token[:20])
 
                 payload = verify_decode_jwt(token)
-                print(f"✅ Token Decoded Successfully: {payload}")
+                logger.debug("✅ Token Decoded Successfully: %s", payload)
 
                 check_permissions(permission, payload)
-                print(f"✅ Permission {permission} exists in token!")
+                logger.debug("✅ Permission %s exists in token!", permission)
 
             except Exception as e:
-                print(f"🚨 Authorization Error: {str(e)}")
+                logger.debug("🚨 Authorization Error: %s", e)
                 raise e
 
-            print("✅ Passing control to the actual route function...")
+            logger.debug("✅ Passing control to the actual route function...")
             return f(payload, *args, **kwargs)
 
         return wrapper
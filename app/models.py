@@ -1,137 +1,258 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import Sequence, delete, event, insert, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from dataclasses import dataclass
+from datetime import date, datetime
 import json
-import os
+import operator
+import orjson
+from config import Config
 
 db = SQLAlchemy()
 
+# BIGINT ids on PostgreSQL; SQLite only auto-increments plain INTEGER primary keys
+BigIntId = db.BigInteger().with_variant(db.Integer, 'sqlite')
+
+# Bound once so Movie() skips the attribute lookup when given an ISO string
+_parse_iso = datetime.fromisoformat
+
+# format() fetches all of a row's fields in one C-level attrgetter call
+_MOVIE_GET = operator.attrgetter('id', 'title', 'release_date')
+_ACTOR_GET = operator.attrgetter('id', 'name', 'age', 'gender')
+
+# Slotted records orjson serializes straight to JSON objects, with no per-row dict.
+# __slots__ is declared by hand because dataclass(slots=True) needs Python 3.10
+@dataclass(frozen=True)
+class MovieView:
+    __slots__ = ('id', 'title', 'release_date')
+    id: int
+    title: str
+    release_date: date
+
+@dataclass(frozen=True)
+class ActorView:
+    __slots__ = ('id', 'name', 'age', 'gender')
+    id: int
+    name: str
+    age: int
+    gender: str
+
 def setup_db(app):
     """Binds a Flask application and a SQLAlchemy service"""
-    
-    # Fetch database URL from environment variable (use Heroku DB when deployed)
-    database_path = os.getenv('DATABASE_URL', 'postgresql://localhost:5432/castingagency')
-    
-    # Heroku may prepend "postgres://" instead of "postgresql://"
-    if database_path.startswith("postgres://"):
-        database_path = database_path.replace("postgres://", "postgresql://", 1)
-
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # ✅ Prevent multiple `db.init_app(app)` calls with a flag set on the app
+    if getattr(app, '_db_initialized', False):
+        return
 
-    # ✅ Prevent multiple `db.init_app(app)` calls
-    if not hasattr(app, 'extensions') or 'sqlalchemy' not in app.extensions:
-        db.init_app(app)    
+    # The database URL and engine options are resolved once, when config.py is imported;
+    # an app that create_app() already configured (or a test config overrode) keeps its own
+    if 'SQLALCHEMY_DATABASE_URI' not in app.config:
+        app.config.from_object(Config)
+    db.init_app(app)
+    app._db_initialized = True
     # db.app = app
     # db.init_app(app)
 
-class Movie(db.Model):
-    """Movie Model representing movies in the casting agency"""
-    __tablename__ = 'movies'
+def fetch_json_array(model):
+    """Returns a model's rows as a JSON array string, aggregated inside the database when it can"""
+    sql = model.LIST_JSON_SQL.get(db.engine.dialect.name)
+    if sql is None:
+        # No JSON aggregate for this database, so encode plain Core rows instead
+        return orjson.dumps(model.list_all()).decode()
+    # Aggregates over an empty table come back as NULL on PostgreSQL
+    return db.session.execute(sql).scalar() or '[]'
 
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(120), nullable=False)
-    release_date = db.Column(db.DateTime, nullable=False)
-    
-    def __init__(self, title, release_date):
-        self.title = title
-        self.release_date = release_date
+class CRUDMixin:
+    """Insert/update/delete and listing methods shared by Movie and Actor
+
+    The write methods only execute or flush; create_app() commits the session
+    once per request after the view succeeds.
+    """
 
     def insert(self):
-        """Inserts a new movie into the database"""
+        """Inserts a new row into the database and returns its id"""
         try:
+            # Adding the instance keeps it persistent, so later changes and update()
+            # reach the database; the flush gets the id back via INSERT ... RETURNING
             db.session.add(self)
-            db.session.commit()
+            db.session.flush()
             return self.id
-        except:
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+
+    @classmethod
+    def insert_many(cls, rows, page_size=1000):
+        """Inserts a list of row dicts in batched multi-row INSERTs and returns their ids in order"""
+        if not rows:
+            return []
+        try:
+            # insertmanyvalues sends page_size rows per INSERT ... RETURNING
+            ids = db.session.scalars(
+                insert(cls).returning(cls.id, sort_by_parameter_order=True),
+                rows,
+                execution_options={'insertmanyvalues_page_size': page_size}
+            ).all()
+            return ids
+        except SQLAlchemyError:
             db.session.rollback()
             raise
-        finally:
-            db.session.close()
 
     def update(self):
-        """Updates an existing movie in the database"""
+        """Updates an existing row in the database"""
         try:
-            db.session.commit()
-        except:
+            db.session.flush()
+        except SQLAlchemyError:
             db.session.rollback()
             raise
-        finally:
-            db.session.close()
 
     def delete(self):
-        """Deletes a movie from the database"""
+        """Deletes a row from the database"""
         try:
             db.session.delete(self)
-            db.session.commit()
-        except:
+            db.session.flush()
+        except SQLAlchemyError:
             db.session.rollback()
             raise
-        finally:
-            db.session.close()
+
+    @classmethod
+    def delete_by_id(cls, pk):
+        """Deletes a row by id in one DELETE ... RETURNING and returns the id, or None if it didn't exist"""
+        try:
+            return db.session.execute(delete(cls).where(cls.id == pk).returning(cls.id)).scalar_one_or_none()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+
+    @classmethod
+    def list_etag(cls):
+        """Returns an ETag for the whole table, read from its table_versions row by primary key"""
+        version = db.session.execute(
+            select(TableVersion.version).where(TableVersion.name == cls.__tablename__)
+        ).scalar()
+        return f'{cls.__tablename__}-{version or 0}'
+
+    @classmethod
+    def list_json(cls):
+        """Returns every row as a JSON array string"""
+        return fetch_json_array(cls)
+
+    @classmethod
+    def list_all(cls):
+        """Returns every row as a plain dict, skipping ORM instance construction"""
+        return [dict(row._mapping) for row in db.session.execute(select(*cls.__table__.c))]
+
+class Movie(CRUDMixin, db.Model):
+    """Movie Model representing movies in the casting agency"""
+    __tablename__ = 'movies'
+    # Lets title-sorted or title-filtered listings be served from the index alone
+    __table_args__ = (db.Index('ix_movies_title_release', 'title', 'release_date'),)
+
+    # Sessions grab 50 ids per nextval() round-trip
+    id = db.Column(BigIntId, Sequence('movies_id_seq', cache=50), primary_key=True)
+    title = db.Column(db.String(120), nullable=False)
+    release_date = db.Column(db.Date, nullable=False, index=True)
+    
+    # Builds the GET /movies array in one statement, formatted like format()
+    LIST_JSON_SQL = {
+        'postgresql': text(
+            "SELECT json_agg(json_build_object("
+            "'id', id, 'title', title, "
+            "'release_date', release_date"
+            "))::text FROM movies"
+        ),
+        'sqlite': text(
+            "SELECT json_group_array(json_object("
+            "'id', id, 'title', title, "
+            "'release_date', release_date"
+            ")) FROM movies"
+        ),
+    }
+
+    def __init__(self, title, release_date):
+        self.title = title
+        # Accept ISO strings and datetimes as well as dates; the column only stores the date
+        if isinstance(release_date, str):
+            release_date = _parse_iso(release_date)
+        if isinstance(release_date, datetime):
+            release_date = release_date.date()
+        self.release_date = release_date
 
     def format(self):
-        """Returns a dictionary representation of the Movie model"""
-        return {
-            'id': self.id,
-            'title': self.title,
-            'release_date': self.release_date.isoformat()
-        }
-
-class Actor(db.Model):
+        """Returns a MovieView of the Movie model for orjson/jsonify"""
+        # release_date stays a date; orjson serializes it natively
+        return MovieView(*_MOVIE_GET(self))
+
+class Actor(CRUDMixin, db.Model):
     """Actor Model representing actors in the casting agency"""
     __tablename__ = 'actors'
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    id = db.Column(BigIntId, Sequence('actors_id_seq', cache=50), primary_key=True)
+    name = db.Column(db.String(120), nullable=False, index=True)
     age = db.Column(db.Integer, nullable=False)
     gender = db.Column(db.String(20), nullable=False)
 
+    # Builds the GET /actors array in one statement, formatted like format()
+    LIST_JSON_SQL = {
+        'postgresql': text(
+            "SELECT json_agg(json_build_object("
+            "'id', id, 'name', name, 'age', age, 'gender', gender"
+            "))::text FROM actors"
+        ),
+        'sqlite': text(
+            "SELECT json_group_array(json_object("
+            "'id', id, 'name', name, 'age', age, 'gender', gender"
+            ")) FROM actors"
+        ),
+    }
+
     def __init__(self, name, age, gender):
         self.name = name
         self.age = age
         self.gender = gender
 
-    def insert(self):
-        """Inserts a new actor into the database"""
-        try:
-            db.session.add(self)
-            db.session.commit()
-            return self.id
-        except:
-            db.session.rollback()
-            raise
-        finally:
-            db.session.close()
+    def format(self):
+        """Returns an ActorView of the Actor model for orjson/jsonify"""
+        return ActorView(*_ACTOR_GET(self))
 
-    def update(self):
-        """Updates an existing actor in the database"""
-        try:
-            db.session.commit()
-        except:
-            db.session.rollback()
-            raise
-        finally:
-            db.session.close()
 
-    def delete(self):
-        """Deletes an actor from the database"""
-        try:
-            db.session.delete(self)
-            db.session.commit()
-        except:
-            db.session.rollback()
-            raise
-        finally:
-            db.session.close()
+class TableVersion(db.Model):
+    """Write counter per table; every insert/update/delete bumps it in the same transaction"""
+    __tablename__ = 'table_versions'
 
-    def format(self):
-        """Returns a dictionary representation of the Actor model"""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'age': self.age,
-            'gender': self.gender
-        }
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+_VERSIONED_TABLES = frozenset((Movie.__tablename__, Actor.__tablename__))
+
+def _bump_versions(connection, names):
+    """Increments the table_versions rows for the given tables"""
+    # The UPDATE row-locks each counter until commit, so versions advance in commit order
+    for name in sorted(names):
+        connection.execute(
+            update(TableVersion.__table__)
+            .where(TableVersion.__table__.c.name == name)
+            .values(version=TableVersion.__table__.c.version + 1)
+        )
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_on_statement(orm_execute_state):
+    """Bumps the version for INSERT/UPDATE/DELETE statements run through a session (routes, insert_many)"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        name = orm_execute_state.statement.table.name
+        if name in _VERSIONED_TABLES:
+            _bump_versions(orm_execute_state.session.connection(), [name])
 
+@event.listens_for(Session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    """Bumps the version for rows written by a flush (insert(), update(), delete())"""
+    changed = {obj.__tablename__ for obj in (*session.new, *session.dirty, *session.deleted)
+               if isinstance(obj, CRUDMixin)}
+    if changed:
+        _bump_versions(session.connection(), changed)
 
+@event.listens_for(TableVersion.__table__, 'after_create')
+def _seed_versions(target, connection, **kw):
+    """Starts every versioned table at 0 when create_all() builds the schema"""
+    connection.execute(target.insert(), [{'name': name, 'version': 0} for name in sorted(_VERSIONED_TABLES)])
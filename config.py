@@ -1,5 +1,38 @@
 import os
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+
+# config is imported before app.auth, so load .env here or DATABASE_URL from it is missed
+load_dotenv()
+
+# Resolved once at import rather than on every setup_db() call
+DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://localhost:5432/castingagency')
+
+# Heroku may prepend "postgres://" instead of "postgresql://"
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+# Keep warm connections around for reuse across requests instead of
+# reconnecting; LIFO hands out the most recently used connection first
+# and pre-ping cheaply detects connections dropped by the server
+ENGINE_OPTIONS = {
+    "pool_size": 25,
+    "max_overflow": 25,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+    "pool_use_lifo": True,
+    "insertmanyvalues_page_size": 1000,
+}
+
+_driver = make_url(DATABASE_URL).get_dialect().driver
+if _driver == "psycopg2":
+    # psycopg2 sends multi-row INSERTs as batched VALUES lists
+    ENGINE_OPTIONS["executemany_mode"] = "values_plus_batch"
+elif _driver == "psycopg":
+    # psycopg 3 server-side prepares a statement after its 5th execution on a connection
+    ENGINE_OPTIONS["connect_args"] = {"prepare_threshold": 5}
 
 class Config:
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'postgresql://localhost:5432/castingagency')
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = ENGINE_OPTIONS
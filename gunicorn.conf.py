@@ -0,0 +1,21 @@
+# Gunicorn settings (picked up automatically from the working directory)
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """Fetch the Auth0 JWKS in the master so no worker pays for it on its first request"""
+    from app.auth import AuthError, fetch_jwks_keys
+
+    try:
+        fetch_jwks_keys()
+    except AuthError:
+        server.log.warning("Could not prefetch JWKS keys; workers will fetch them on demand")
+
+
+def post_fork(server, worker):
+    """Start each worker's own log queue listener; a thread started in the master wouldn't survive the fork"""
+    from app.app import configure_logging
+
+    configure_logging()
@@ -0,0 +1,36 @@
+"""BIGINT ids with cached sequences, indexes on actors.name and movies.release_date
+
+Revision ID: 3f1c9a7b2d4e
+Revises: cea28f6628f8
+Create Date: 2026-10-15 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7b2d4e'
+down_revision = 'cea28f6628f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('actors', 'id', existing_type=sa.Integer(), type_=sa.BigInteger())
+    op.alter_column('movies', 'id', existing_type=sa.Integer(), type_=sa.BigInteger())
+    op.execute('ALTER SEQUENCE actors_id_seq AS bigint CACHE 50')
+    op.execute('ALTER SEQUENCE movies_id_seq AS bigint CACHE 50')
+
+    op.create_index(op.f('ix_actors_name'), 'actors', ['name'], unique=False)
+    op.create_index(op.f('ix_movies_release_date'), 'movies', ['release_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_movies_release_date'), table_name='movies')
+    op.drop_index(op.f('ix_actors_name'), table_name='actors')
+
+    op.execute('ALTER SEQUENCE movies_id_seq AS integer CACHE 1')
+    op.execute('ALTER SEQUENCE actors_id_seq AS integer CACHE 1')
+    op.alter_column('movies', 'id', existing_type=sa.BigInteger(), type_=sa.Integer())
+    op.alter_column('actors', 'id', existing_type=sa.BigInteger(), type_=sa.Integer())
@@ -0,0 +1,32 @@
+"""Store movies.release_date as DATE
+
+Revision ID: 8b2e4d61c0a9
+Revises: 3f1c9a7b2d4e
+Create Date: 2026-10-15 11:04:27.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d61c0a9'
+down_revision = '3f1c9a7b2d4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('movies', 'release_date',
+               existing_type=sa.DateTime(),
+               type_=sa.Date(),
+               existing_nullable=False,
+               postgresql_using='release_date::date')
+
+
+def downgrade():
+    op.alter_column('movies', 'release_date',
+               existing_type=sa.Date(),
+               type_=sa.DateTime(),
+               existing_nullable=False,
+               postgresql_using='release_date::timestamp')
@@ -0,0 +1,24 @@
+"""Add covering index on movies(title, release_date)
+
+Revision ID: c47a1e90d3b5
+Revises: 8b2e4d61c0a9
+Create Date: 2026-10-15 11:31:52.106482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1e90d3b5'
+down_revision = '8b2e4d61c0a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_movies_title_release', 'movies', ['title', 'release_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_movies_title_release', table_name='movies')
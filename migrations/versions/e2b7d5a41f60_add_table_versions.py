@@ -0,0 +1,30 @@
+"""Add table_versions counters for list ETags
+
+Revision ID: e2b7d5a41f60
+Revises: c47a1e90d3b5
+Create Date: 2026-10-15 17:44:09.236118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7d5a41f60'
+down_revision = 'c47a1e90d3b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [{'name': 'actors', 'version': 0}, {'name': 'movies', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('table_versions')
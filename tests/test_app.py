@@ -1,71 +1,153 @@
+import logging
 import os
+import subprocess
+import sys
+import time
 import unittest
-import json
-from flask_sqlalchemy import SQLAlchemy
+import jwt
+import orjson
+import requests
+from cachetools import TTLCache
+from cryptography.hazmat.primitives.asymmetric import rsa
+from sqlalchemy import select
+from sqlalchemy.orm import scoped_session, sessionmaker
 from app.app import create_app
-from app.models import setup_db, Actor, Movie
+from app.models import Actor, Movie
 from datetime import datetime
 from app.models import db  # ✅ Import existing db instance
 from unittest.mock import patch
-from app.auth import verify_decode_jwt
+from app import auth
+from app.auth import verify_decode_jwt, check_permissions, AuthError, API_AUDIENCE, AUTH0_DOMAIN
+
+
+# Everything runs against one in-memory SQLite database; flask-sqlalchemy gives
+# sqlite:// a StaticPool, so every connection sees the same tables. Pool sizing
+# from config.py doesn't apply to a single static connection
+TEST_CONFIG = {
+    'TESTING': True,
+    'PROPAGATE_EXCEPTIONS': True,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SQLALCHEMY_ENGINE_OPTIONS': {},
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,  # No model-change signals to fire
+    'SQLALCHEMY_ECHO': False,  # Don't log every statement
+}
+
+# Mocked permissions
+ASSISTANT_PERMS = {"sub": "assistant", "permissions": ["get:actors", "get:movies"]}
+DIRECTOR_PERMS = {"sub": "director", "permissions": [
+    "get:actors", "post:actors", "patch:actors", "delete:actors",
+    "get:movies", "patch:movies"
+]}
+PRODUCER_PERMS = {"sub": "producer", "permissions": [
+    "get:actors", "post:actors", "patch:actors", "delete:actors",
+    "get:movies", "post:movies", "patch:movies", "delete:movies"
+]}
+
+# Bearer token -> decoded payload the patched verify_decode_jwt returns
+TOKENS = {
+    'assistant_token': ASSISTANT_PERMS,
+    'director_token': DIRECTOR_PERMS,
+    'producer_token': PRODUCER_PERMS,
+}
+
+# Authorization headers for the different roles
+AUTH_HEADERS = {
+    'assistant': {'Authorization': 'Bearer assistant_token'},
+    'director': {'Authorization': 'Bearer director_token'},
+    'producer': {'Authorization': 'Bearer producer_token'},
+}
 
 
 class CastingAgencyTestCase(unittest.TestCase):
     """This class represents the casting agency test case"""
 
+    # Test data, plus request bodies encoded once instead of on every POST
+    new_movie = {'title': 'Test Movie', 'release_date': '2024-01-01T00:00:00'}
+    new_actor = {'name': 'Test Actor', 'age': 30, 'gender': 'Male'}
+    new_movie_json = orjson.dumps(new_movie)
+    new_actor_json = orjson.dumps(new_actor)
+
+    # (role, method, path, body, expected status) for the RBAC table test
+    RBAC_CASES = [
+        ('assistant', 'GET', '/actors', None, 200),
+        ('assistant', 'GET', '/movies', None, 200),
+        ('assistant', 'POST', '/actors', new_actor_json, 403),
+        ('assistant', 'POST', '/movies', new_movie_json, 403),
+        ('director', 'POST', '/actors', new_actor_json, 201),
+        ('director', 'POST', '/movies', new_movie_json, 403),
+        ('director', 'PATCH', '/movies/{movie_id}', orjson.dumps({'title': 'Updated Movie'}), 200),
+        ('director', 'DELETE', '/movies/{movie_id}', None, 403),
+        ('producer', 'POST', '/movies', new_movie_json, 201),
+        ('producer', 'DELETE', '/movies/{movie_id}', None, 200),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        """Build the app and client once and create the schema once for the whole class"""
+        cls.app = create_app(TEST_CONFIG)
+        cls.client = cls.app.test_client()
+        # The in-memory database starts empty, and every test rolls its own rows back
+        with cls.app.app_context():
+            db.create_all()
+            # One committed actor and movie for the update/delete tests to work on;
+            # per-test rollback puts them back after a test changes or deletes them
+            cls.actor_id = Actor(name='Seed Actor', age=40, gender='Female').insert()
+            cls.movie_id = Movie(title='Seed Movie', release_date='2024-01-01').insert()
+            db.session.commit()
+            db.session.remove()
+
+        # One signing key and one JWKS patcher for the JWT tests, started and
+        # stopped by each test rather than rebuilt by a with-block every time
+        cls.signing_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls._jwks_patcher = patch('app.auth.fetch_jwks_keys', return_value={'test-key': cls.signing_key.public_key()})
+
+        # requires_auth looks verify_decode_jwt up on app.auth per call, so one
+        # class-wide patch answers the role tokens without touching Auth0
+        cls._token_patcher = patch.object(auth, 'verify_decode_jwt', side_effect=TOKENS.get)
+        cls._token_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Put the real token verification back"""
+        cls._token_patcher.stop()
+
     def setUp(self):
-        """Define test variables and initialize app"""
-        self.app = create_app()
-        self.client = self.app.test_client
-        setup_db(self.app)  # ✅ Correctly initializes DB
-
-        # Test data
-        self.new_movie = {'title': 'Test Movie', 'release_date': '2024-01-01T00:00:00'}
-        self.new_actor = {'name': 'Test Actor', 'age': 30, 'gender': 'Male'}
-
-        # Mocked permissions
-        self.assistant_permissions = {"sub": "assistant", "permissions": ["get:actors", "get:movies"]}
-        self.director_permissions = {"sub": "director", "permissions": [
-            "get:actors", "post:actors", "patch:actors", "delete:actors",
-            "get:movies", "patch:movies"
-        ]}
-        self.producer_permissions = {"sub": "producer", "permissions": [
-            "get:actors", "post:actors", "patch:actors", "delete:actors",
-            "get:movies", "post:movies", "patch:movies", "delete:movies"
-        ]}
-
-        # Define authorization headers for different roles
-        self.assistant_auth_header = {
-            'Authorization': 'Bearer assistant_token'
-        }
-        self.director_auth_header = {
-            'Authorization': 'Bearer director_token'
-        }
-        self.producer_auth_header = {
-            'Authorization': 'Bearer producer_token'
-        }
+        """Isolate the test in a transaction"""
+        # One app context per test, so tests can use db directly
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+        # Run the whole test inside one outer transaction; the app's commits only
+        # release savepoints, and tearDown rolls everything back
+        self.connection = db.engine.connect()
+        self.trans = self.connection.begin()
+        if self.connection.dialect.name == 'sqlite':
+            # pysqlite begins transactions lazily, so RELEASE SAVEPOINT would commit;
+            # take over transaction control on this connection for the test
+            self.connection.connection.driver_connection.isolation_level = None
+            self.connection.exec_driver_sql('BEGIN')
+        self.app_session = db.session
+        db.session = scoped_session(sessionmaker(bind=self.connection, join_transaction_mode='create_savepoint'))
 
     def tearDown(self):
         """Executed after each test"""
-        pass
-
-    def mock_verify_decode_jwt(self, token):
-        """Mock function to return different permissions based on the token"""
-        if token == 'assistant_token':
-            return self.assistant_permissions
-        elif token == 'director_token':
-            return self.director_permissions
-        elif token == 'producer_token':
-            return self.producer_permissions
-        else:
-            return {}
+        db.session.remove()
+        db.session = self.app_session
+        self.trans.rollback()
+        if self.connection.dialect.name == 'sqlite':
+            self.connection.connection.driver_connection.isolation_level = ''
+        self.connection.close()
+        self.ctx.pop()
+
+    def seed_actors(self, n):
+        """Insert n actors in one batched INSERT, skipping the HTTP layer, and return their ids"""
+        return Actor.insert_many([dict(self.new_actor, name=f'Seed Actor {i}') for i in range(n)])
 
     # Success behavior tests for each endpoint
     def test_get_actors_success(self):
         """Test successful GET actors"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.assistant_permissions):
-            res = self.client().get('/actors', headers=self.assistant_auth_header)
-        data = json.loads(res.data)
+        res = self.client.get('/actors', headers=AUTH_HEADERS['assistant'])
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
@@ -73,19 +155,69 @@ class CastingAgencyTestCase(unittest.TestCase):
 
     def test_get_movies_success(self):
         """Test successful GET movies"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.assistant_permissions):
-            res = self.client().get('/movies', headers=self.assistant_auth_header)
-        data = json.loads(res.data)
+        res = self.client.get('/movies', headers=AUTH_HEADERS['assistant'])
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         self.assertTrue('movies' in data)
 
+    def test_get_movies_includes_seeded_movie(self):
+        """Test GET movies returns stored movies formatted like the other endpoints"""
+        res = self.client.get('/movies', headers=AUTH_HEADERS['producer'])
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn({'id': self.movie_id, 'title': 'Seed Movie', 'release_date': '2024-01-01'}, data['movies'])
+
+    def test_get_movies_not_modified(self):
+        """Test GET movies answers a matching If-None-Match with 304 until the table changes"""
+        first = self.client.get('/movies', headers=AUTH_HEADERS['producer'])
+        etag = first.headers['ETag']
+
+        cached = self.client.get('/movies', headers={**AUTH_HEADERS['producer'], 'If-None-Match': etag})
+        self.client.post('/movies', headers=AUTH_HEADERS['producer'], data=self.new_movie_json, content_type='application/json')
+        changed = self.client.get('/movies', headers={**AUTH_HEADERS['producer'], 'If-None-Match': etag})
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+    def test_get_movies_etag_changes_after_update(self):
+        """Test a PATCH in the same second as the previous GET still invalidates the ETag"""
+        etag = self.client.get('/movies', headers=AUTH_HEADERS['producer']).headers['ETag']
+
+        self.client.patch(f'/movies/{self.movie_id}', headers=AUTH_HEADERS['producer'], json={'title': 'Renamed Movie'})
+        res = self.client.get('/movies', headers={**AUTH_HEADERS['producer'], 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertIn('Renamed Movie', [movie['title'] for movie in res.get_json()['movies']])
+
+    def test_get_movies_not_modified_skips_list_query(self):
+        """Test a matching If-None-Match is answered without running the list query"""
+        etag = self.client.get('/movies', headers=AUTH_HEADERS['producer']).headers['ETag']
+
+        with patch.object(Movie, 'list_json') as list_json:
+            res = self.client.get('/movies', headers={**AUTH_HEADERS['producer'], 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        list_json.assert_not_called()
+
+    def test_get_actors_etag_changes_after_delete(self):
+        """Test deleting a row invalidates the list ETag"""
+        etag = self.client.get('/actors', headers=AUTH_HEADERS['producer']).headers['ETag']
+
+        self.client.delete(f'/actors/{self.actor_id}', headers=AUTH_HEADERS['producer'])
+        res = self.client.get('/actors', headers={**AUTH_HEADERS['producer'], 'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
     def test_create_actor_success(self):
         """Test successful POST actor"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().post('/actors', headers=self.director_auth_header, json=self.new_actor)
-        data = json.loads(res.data)
+        res = self.client.post('/actors', headers=AUTH_HEADERS['director'], data=self.new_actor_json, content_type='application/json')
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 201)
         self.assertTrue(data['success'])
@@ -93,9 +225,8 @@ class CastingAgencyTestCase(unittest.TestCase):
 
     def test_create_movie_success(self):
         """Test successful POST movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-        data = json.loads(res.data)
+        res = self.client.post('/movies', headers=AUTH_HEADERS['producer'], data=self.new_movie_json, content_type='application/json')
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 201)
         self.assertTrue(data['success'])
@@ -103,14 +234,11 @@ class CastingAgencyTestCase(unittest.TestCase):
 
     def test_update_actor_success(self):
         """Test successful PATCH actor"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            actor_res = self.client().post('/actors', headers=self.director_auth_header, json=self.new_actor)
-            actor_id = json.loads(actor_res.data)['created']
+        actor_id = self.actor_id
 
         update_data = {'age': 31}
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().patch(f'/actors/{actor_id}', headers=self.director_auth_header, json=update_data)
-        data = json.loads(res.data)
+        res = self.client.patch(f'/actors/{actor_id}', headers=AUTH_HEADERS['director'], json=update_data)
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
@@ -118,28 +246,23 @@ class CastingAgencyTestCase(unittest.TestCase):
 
     def test_update_movie_success(self):
         """Test successful PATCH movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            movie_res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-            movie_id = json.loads(movie_res.data)['created']
+        movie_id = self.movie_id
 
         update_data = {'title': 'Updated Test Movie'}
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().patch(f'/movies/{movie_id}', headers=self.director_auth_header, json=update_data)
-        data = json.loads(res.data)
+        res = self.client.patch(f'/movies/{movie_id}', headers=AUTH_HEADERS['director'], json=update_data)
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         self.assertEqual(data['movie']['title'], 'Updated Test Movie')
+        self.assertEqual(data['movie']['release_date'], '2024-01-01')
 
     def test_delete_actor_success(self):
         """Test successful DELETE actor"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            actor_res = self.client().post('/actors', headers=self.director_auth_header, json=self.new_actor)
-            actor_id = json.loads(actor_res.data)['created']
+        actor_id = self.actor_id
 
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().delete(f'/actors/{actor_id}', headers=self.director_auth_header)
-        data = json.loads(res.data)
+        res = self.client.delete(f'/actors/{actor_id}', headers=AUTH_HEADERS['director'])
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
@@ -147,31 +270,64 @@ class CastingAgencyTestCase(unittest.TestCase):
 
     def test_delete_movie_success(self):
         """Test successful DELETE movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            movie_res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-            movie_id = json.loads(movie_res.data)['created']
+        movie_id = self.movie_id
 
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            res = self.client().delete(f'/movies/{movie_id}', headers=self.producer_auth_header)
-        data = json.loads(res.data)
+        res = self.client.delete(f'/movies/{movie_id}', headers=AUTH_HEADERS['producer'])
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         self.assertEqual(data['deleted'], movie_id)
 
+    def test_movie_list_all(self):
+        """Test listing movies as plain dicts without ORM instances"""
+        movie_id = Movie(title='Listed Movie', release_date=datetime(2024, 1, 1)).insert()
+
+        self.assertIn({'id': movie_id, 'title': 'Listed Movie', 'release_date': datetime(2024, 1, 1).date()}, Movie.list_all())
+
+    def test_movie_parses_iso_release_date(self):
+        """Test that Movie() stores ISO strings and datetimes as dates"""
+        self.assertEqual(Movie(title='Parsed', release_date='2024-01-01T00:00:00').release_date, datetime(2024, 1, 1).date())
+        self.assertEqual(Movie(title='Parsed', release_date=datetime(2024, 1, 1, 12)).release_date, datetime(2024, 1, 1).date())
+
+    def test_actor_format_serializes_as_object(self):
+        """Test that format() output encodes to the same JSON object as before"""
+        actor = Actor(**self.new_actor)
+        actor.insert()
+
+        self.assertEqual(orjson.loads(orjson.dumps(actor.format())), dict(self.new_actor, id=actor.id))
+
+    def test_actor_insert_keeps_instance_persistent(self):
+        """Test an inserted actor stays in the session, so later changes reach the database"""
+        actor = Actor(**self.new_actor)
+        actor.insert()
+        actor.age = 45
+        actor.update()
+
+        self.assertIn(actor, db.session)
+        self.assertEqual(db.session.execute(select(Actor.age).where(Actor.id == actor.id)).scalar_one(), 45)
+
+    def test_actor_insert_many(self):
+        """Test inserting several actors in batched statements"""
+        rows = [dict(self.new_actor, name=f'Actor {i}') for i in range(5)]
+        ids = Actor.insert_many(rows, page_size=2)
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual([db.session.get(Actor, i).name for i in ids], [row['name'] for row in rows])
+
     # Error behavior tests for each endpoint
     def test_get_actors_error(self):
         """Test error behavior for GET actors"""
-        res = self.client().get('/actors')  # No auth header
-        data = json.loads(res.data)
+        res = self.client.get('/actors')  # No auth header
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 401)
         self.assertFalse(data['success'])
 
     def test_get_movies_error(self):
         """Test error behavior for GET movies"""
-        res = self.client().get('/movies')  # No auth header
-        data = json.loads(res.data)
+        res = self.client.get('/movies')  # No auth header
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 401)
         self.assertFalse(data['success'])
@@ -179,9 +335,8 @@ class CastingAgencyTestCase(unittest.TestCase):
     def test_create_actor_error(self):
         """Test error behavior for POST actor"""
         # Missing required fields
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().post('/actors', headers=self.director_auth_header, json={'name': 'Test Actor'})  # Missing age and gender
-        data = json.loads(res.data)
+        res = self.client.post('/actors', headers=AUTH_HEADERS['director'], json={'name': 'Test Actor'})  # Missing age and gender
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 400)
         self.assertFalse(data['success'])
@@ -189,9 +344,16 @@ class CastingAgencyTestCase(unittest.TestCase):
     def test_create_movie_error(self):
         """Test error behavior for POST movie"""
         # Missing required fields
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            res = self.client().post('/movies', headers=self.producer_auth_header, json={'title': 'Test Movie'})  # Missing release_date
-        data = json.loads(res.data)
+        res = self.client.post('/movies', headers=AUTH_HEADERS['producer'], json={'title': 'Test Movie'})  # Missing release_date
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
+    def test_create_movie_invalid_release_date(self):
+        """Test POST movie with a malformed release date is a bad request"""
+        res = self.client.post('/movies', headers=AUTH_HEADERS['producer'], json={'title': 'Test Movie', 'release_date': 'not a date'})
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 400)
         self.assertFalse(data['success'])
@@ -199,9 +361,8 @@ class CastingAgencyTestCase(unittest.TestCase):
     def test_update_actor_error(self):
         """Test error behavior for PATCH actor"""
         # Non-existent actor ID
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().patch('/actors/9999', headers=self.director_auth_header, json={'age': 31})
-        data = json.loads(res.data)
+        res = self.client.patch('/actors/9999', headers=AUTH_HEADERS['director'], json={'age': 31})
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 404)
         self.assertFalse(data['success'])
@@ -209,9 +370,8 @@ class CastingAgencyTestCase(unittest.TestCase):
     def test_update_movie_error(self):
         """Test error behavior for PATCH movie"""
         # Non-existent movie ID
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().patch('/movies/9999', headers=self.director_auth_header, json={'title': 'Updated Test Movie'})
-        data = json.loads(res.data)
+        res = self.client.patch('/movies/9999', headers=AUTH_HEADERS['director'], json={'title': 'Updated Test Movie'})
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 404)
         self.assertFalse(data['success'])
@@ -219,9 +379,8 @@ class CastingAgencyTestCase(unittest.TestCase):
     def test_delete_actor_error(self):
         """Test error behavior for DELETE actor"""
         # Non-existent actor ID
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().delete('/actors/9999', headers=self.director_auth_header)
-        data = json.loads(res.data)
+        res = self.client.delete('/actors/9999', headers=AUTH_HEADERS['director'])
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 404)
         self.assertFalse(data['success'])
@@ -229,115 +388,185 @@ class CastingAgencyTestCase(unittest.TestCase):
     def test_delete_movie_error(self):
         """Test error behavior for DELETE movie"""
         # Non-existent movie ID
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            res = self.client().delete('/movies/9999', headers=self.producer_auth_header)
-        data = json.loads(res.data)
+        res = self.client.delete('/movies/9999', headers=AUTH_HEADERS['producer'])
+        data = res.get_json()
 
         self.assertEqual(res.status_code, 404)
         self.assertFalse(data['success'])
 
-    # RBAC tests for Casting Assistant
-    def test_casting_assistant_get_actors(self):
-        """Test Casting Assistant can get actors"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.assistant_permissions):
-            res = self.client().get('/actors', headers=self.assistant_auth_header)
-        self.assertEqual(res.status_code, 200)
-
-    def test_casting_assistant_get_movies(self):
-        """Test Casting Assistant can get movies"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.assistant_permissions):
-            res = self.client().get('/movies', headers=self.assistant_auth_header)
-        self.assertEqual(res.status_code, 200)
-
-    def test_casting_assistant_create_actor_forbidden(self):
-        """Test Casting Assistant cannot create actor"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.assistant_permissions):
-            res = self.client().post('/actors', headers=self.assistant_auth_header, json=self.new_actor)
-        self.assertEqual(res.status_code, 403)
-
-    def test_casting_assistant_create_movie_forbidden(self):
-        """Test Casting Assistant cannot create movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.assistant_permissions):
-            res = self.client().post('/movies', headers=self.assistant_auth_header, json=self.new_movie)
-        self.assertEqual(res.status_code, 403)
-
-    # RBAC tests for Casting Director
-    def test_casting_director_create_actor(self):
-        """Test Casting Director can create actor"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().post('/actors', headers=self.director_auth_header, json=self.new_actor)
-        self.assertEqual(res.status_code, 201)
+    def test_cors_preflight(self):
+        """Test CORS preflight is answered without an Authorization header"""
+        res = self.client.options('/actors', headers={
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'POST',
+            'Access-Control-Request-Headers': 'Authorization'
+        })
+
+        self.assertEqual(res.status_code, 204)
+        self.assertIn('POST', res.headers['Access-Control-Allow-Methods'])
+        self.assertIn('authorization', res.headers['Access-Control-Allow-Headers'].lower())
+
+    def test_testing_app_skips_jwks_prefetch(self):
+        """Test a TESTING app never starts the background Auth0 JWKS fetch"""
+        with patch('app.app.warm_jwks_cache') as warm:
+            create_app(TEST_CONFIG)
+
+        warm.assert_not_called()
+
+    def test_create_app_leaves_root_logging_alone(self):
+        """Test the factory doesn't add handlers to, or change the level of, the root logger"""
+        root = logging.getLogger()
+        handlers, level = list(root.handlers), root.level
+
+        create_app(TEST_CONFIG)
+
+        self.assertEqual((root.handlers, root.level), (handlers, level))
+
+    def test_importing_app_starts_no_threads(self):
+        """Test importing app.app builds no app, so no JWKS fetch or engine starts"""
+        code = 'import threading, app.app; print(threading.active_count())'
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+        self.assertEqual(out.strip(), '1')
+
+    def test_options_outside_preflight_is_not_short_circuited(self):
+        """Test OPTIONS on unknown paths or for unserved methods isn't answered with 204"""
+        unknown = self.client.options('/nope', headers={'Access-Control-Request-Method': 'GET'})
+        unserved = self.client.options('/actors', headers={'Access-Control-Request-Method': 'PUT'})
+        plain = self.client.options('/actors')
+
+        self.assertEqual(unknown.status_code, 404)
+        self.assertNotEqual(unserved.status_code, 204)
+        self.assertNotEqual(plain.status_code, 204)
+
+    # JWT verification tests
+    def make_signed_token(self, **claims):
+        """Sign a token the way Auth0 would, with the given claim overrides"""
+        payload = {
+            'aud': API_AUDIENCE,
+            'iss': f'https://{AUTH0_DOMAIN}/',
+            'exp': time.time() + 60,
+            'permissions': ['get:actors']
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.signing_key, algorithm='RS256', headers={'kid': 'test-key'})
+
+    def test_verify_decode_jwt_success(self):
+        """Test a token signed by a known JWKS key is decoded"""
+        token = self.make_signed_token()
+
+        self._jwks_patcher.start()
+        self.addCleanup(self._jwks_patcher.stop)
+        payload = verify_decode_jwt(token)
+
+        self.assertEqual(payload['permissions'], ['get:actors'])
+
+    def test_verify_decode_jwt_expired(self):
+        """Test an expired token is rejected with 401"""
+        token = self.make_signed_token(exp=time.time() - 60)
+
+        self._jwks_patcher.start()
+        self.addCleanup(self._jwks_patcher.stop)
+        with self.assertRaises(AuthError) as ctx:
+            verify_decode_jwt(token)
+
+        self.assertEqual(ctx.exception.status_code, 401)
+        self.assertEqual(ctx.exception.error['code'], 'token_expired')
+
+    def test_verify_decode_jwt_immature(self):
+        """Test a token that isn't valid yet is rejected as invalid claims with 401"""
+        token = self.make_signed_token(nbf=time.time() + 3600)
+
+        self._jwks_patcher.start()
+        self.addCleanup(self._jwks_patcher.stop)
+        with self.assertRaises(AuthError) as ctx:
+            verify_decode_jwt(token)
+
+        self.assertEqual(ctx.exception.status_code, 401)
+        self.assertEqual(ctx.exception.error['code'], 'invalid_claims')
+
+    def test_verify_decode_jwt_bad_signature(self):
+        """Test a token signed by a different key under a known kid is rejected with 401"""
+        other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        token = jwt.encode({'aud': API_AUDIENCE, 'iss': f'https://{AUTH0_DOMAIN}/', 'exp': time.time() + 60},
+                           other_key, algorithm='RS256', headers={'kid': 'test-key'})
+
+        self._jwks_patcher.start()
+        self.addCleanup(self._jwks_patcher.stop)
+        with self.assertRaises(AuthError) as ctx:
+            verify_decode_jwt(token)
+
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_fetch_jwks_keys_serves_last_good_keys_on_error(self):
+        """Test an Auth0 failure after the TTL falls back to the previous keys and backs off"""
+        good_keys = {'test-key': self.signing_key.public_key()}
+        auth.JWKS_CACHE.pop(auth.AUTH0_DOMAIN, None)  # As if the TTL just expired
+        auth._JWKS_ETAGS[auth.AUTH0_DOMAIN] = ('"etag"', good_keys)
+        self.addCleanup(auth._JWKS_ETAGS.clear)
+        self.addCleanup(auth._JWKS_NEXT_RETRY.clear)
+
+        with patch.object(auth.SESSION, 'get', side_effect=requests.ConnectionError('Auth0 down')) as get:
+            self.assertIs(auth.fetch_jwks_keys(), good_keys)
+            self.assertIs(auth.fetch_jwks_keys(), good_keys)
+
+        self.assertEqual(get.call_count, 1)  # The second call stays inside the retry backoff
+
+    def test_fetch_jwks_keys_survives_expiry_between_check_and_lookup(self):
+        """Test a cache entry expiring between a membership check and the lookup can't raise KeyError"""
+        good_keys = {'test-key': self.signing_key.public_key()}
+
+        class RacingCache(TTLCache):
+            def __contains__(self, key):
+                # Another thread expires the entry right after the membership check
+                found = super().__contains__(key)
+                self.pop(key, None)
+                return found
+
+        cache = RacingCache(maxsize=2, ttl=600)
+        cache[auth.AUTH0_DOMAIN] = good_keys
+
+        with patch.object(auth, 'JWKS_CACHE', cache):
+            self.assertIs(auth.fetch_jwks_keys(), good_keys)
+
+    def test_check_permissions_strips_padding(self):
+        """Test padded permission strings from Auth0 still match"""
+        payload = {'permissions': ['get:actors', 'patch:actors ']}
+
+        self.assertTrue(check_permissions('patch:actors', payload))
+        with self.assertRaises(AuthError) as ctx:
+            check_permissions('delete:actors', payload)
+        self.assertEqual(ctx.exception.status_code, 403)
+        self.assertEqual(payload, {'permissions': ['get:actors', 'patch:actors ']})  # Left untouched
+
+    # RBAC: every role/action pair runs as a subtest of one method
+    def test_rbac(self):
+        """Test each role gets the expected status for each single-request action"""
+        for role, method, path, body, expected in self.RBAC_CASES:
+            with self.subTest(role=role, method=method, path=path):
+                # Each case starts from the seeded rows, untouched by earlier cases
+                savepoint = self.connection.begin_nested()
+                res = self.client.open(path.format(movie_id=self.movie_id), method=method, data=body,
+                                       content_type='application/json', headers=AUTH_HEADERS[role])
+                savepoint.rollback()
+                self.assertEqual(res.status_code, expected)
 
-    def test_casting_director_update_movie(self):
-        """Test Casting Director can update movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            # First create a movie as producer
-            movie_res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-            movie_id = json.loads(movie_res.data).get('created')
-
-            if movie_id:
-                # Then update it as director
-                with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-                    res = self.client().patch(f'/movies/{movie_id}', headers=self.director_auth_header, json={'title': 'Updated Movie'})
-                self.assertEqual(res.status_code, 200)
-            else:
-                self.fail("Movie creation failed in test_casting_director_update_movie")
-
-    def test_casting_director_create_movie_forbidden(self):
-        """Test Casting Director cannot create movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-            res = self.client().post('/movies', headers=self.director_auth_header, json=self.new_movie)
-        self.assertEqual(res.status_code, 403)
-
-    def test_casting_director_delete_movie_forbidden(self):
-        """Test Casting Director cannot delete movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            # First create a movie as producer
-            movie_res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-            movie_id = json.loads(movie_res.data).get('created')
-
-            if movie_id:
-                # Try to delete it as director
-                with patch('app.auth.verify_decode_jwt', return_value=self.director_permissions):
-                    res = self.client().delete(f'/movies/{movie_id}', headers=self.director_auth_header)
-                self.assertEqual(res.status_code, 403)
-            else:
-                self.fail("Movie creation failed in test_casting_director_delete_movie_forbidden")
-
-    # RBAC tests for Executive Producer
-    def test_executive_producer_create_movie(self):
-        """Test Executive Producer can create movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-        self.assertEqual(res.status_code, 201)
+    def test_executive_producer_all_actor_operations(self):
+        """Test Executive Producer has full actor permissions"""
+        # Update and delete act on rows seeded straight into the database
+        updated_id, deleted_id = self.seed_actors(2)
 
-    def test_executive_producer_delete_movie(self):
-        """Test Executive Producer can delete movie"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            # First create a movie
-            movie_res = self.client().post('/movies', headers=self.producer_auth_header, json=self.new_movie)
-            movie_id = json.loads(movie_res.data)['created']
+        # Create actor
+        actor_res = self.client.post('/actors', headers=AUTH_HEADERS['producer'], data=self.new_actor_json, content_type='application/json')
+        self.assertEqual(actor_res.status_code, 201)
 
-            # Then delete it
-            res = self.client().delete(f'/movies/{movie_id}', headers=self.producer_auth_header)
-        self.assertEqual(res.status_code, 200)
+        # Update actor
+        update_res = self.client.patch(f'/actors/{updated_id}', headers=AUTH_HEADERS['producer'], json={'age': 31})
+        self.assertEqual(update_res.status_code, 200)
 
-    def test_executive_producer_all_actor_operations(self):
-        """Test Executive Producer has full actor permissions"""
-        with patch('app.auth.verify_decode_jwt', return_value=self.producer_permissions):
-            # Create actor
-            actor_res = self.client().post('/actors', headers=self.producer_auth_header, json=self.new_actor)
-            self.assertEqual(actor_res.status_code, 201)
-            
-            actor_id = json.loads(actor_res.data)['created']
-
-            # Update actor
-            update_res = self.client().patch(f'/actors/{actor_id}', headers=self.producer_auth_header, json={'age': 31})
-            self.assertEqual(update_res.status_code, 200)
-
-            # Delete actor
-            delete_res = self.client().delete(f'/actors/{actor_id}', headers=self.producer_auth_header)
-            self.assertEqual(delete_res.status_code, 200)
+        # Delete actor
+        delete_res = self.client.delete(f'/actors/{deleted_id}', headers=AUTH_HEADERS['producer'])
+        self.assertEqual(delete_res.status_code, 200)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file